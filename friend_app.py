@@ -2,14 +2,24 @@
 
 import sqlite3
 import logging
-from typing import List, Dict, Set
+import sys
+import heapq
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import lru_cache
+from typing import List, Dict, Set, FrozenSet, Optional, Tuple
 from datetime import datetime
-import networkx as nx
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+_NO_FRIENDS: FrozenSet[int] = frozenset()
+
+def _popcount(bits: int) -> int:
+    # int.bit_count() is 3.10+ only
+    return bin(bits).count('1')
+
 class DatabaseManager:
     def __init__(self, db_path='friend_recommendations.db'):
         self.db_path = db_path
@@ -19,6 +29,12 @@ class DatabaseManager:
         try:
             self.connection = sqlite3.connect(self.db_path)
             self.connection.row_factory = sqlite3.Row
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("PRAGMA synchronous=NORMAL")
+            self.connection.execute("PRAGMA cache_size=-65536")
+            self.connection.execute("PRAGMA temp_store=MEMORY")
+            self.connection.execute("PRAGMA mmap_size=268435456")
+            self.connection.execute("PRAGMA foreign_keys=ON")
             logger.info(f"Connected to database: {self.db_path}")
             return True
         except sqlite3.Error as e:
@@ -63,8 +79,16 @@ class DatabaseManager:
                 )
             """)
 
-            cursor.execute("CREATE INDEX IF NOT EXISTS idx_interests_user_id ON interests(user_id)")
-            cursor.execute("CREATE INDEX IF NOT EXISTS idx_friends_user_id ON friends(user_id)")
+            # UNIQUE(user_id, ...) already gives covering indexes for both bulk scans
+            cursor.execute("""
+                SELECT name FROM sqlite_master
+                WHERE type = 'index' AND name IN ('idx_interests_user_id', 'idx_friends_user_id')
+            """)
+            legacy_indexes = [row['name'] for row in cursor.fetchall()]
+            for name in legacy_indexes:
+                cursor.execute(f"DROP INDEX {name}")
+            if legacy_indexes:
+                cursor.execute("ANALYZE")
 
             self.connection.commit()
             return True
@@ -76,8 +100,13 @@ class DatabaseManager:
 
     def close(self):
         if self.connection:
-            self.connection.close()
-            logger.info("Database closed")
+            try:
+                self.connection.execute("PRAGMA optimize")
+            except sqlite3.Error as e:
+                logger.error(f"Database optimize error: {e}")
+            finally:
+                self.connection.close()
+                logger.info("Database closed")
 
 class User:
     def __init__(self, db: DatabaseManager):
@@ -90,21 +119,19 @@ class User:
             user_id = cursor.lastrowid
 
             if interests:
-                for interest in interests:
-                    try:
-                        cursor.execute("INSERT INTO interests (user_id, interest) VALUES (?, ?)", (user_id, interest.strip().lower()))
-                    except sqlite3.IntegrityError:
-                        continue
+                cursor.executemany(
+                    "INSERT OR IGNORE INTO interests (user_id, interest) VALUES (?, ?)",
+                    [(user_id, interest.strip().lower()) for interest in interests]
+                )
 
             if friend_ids:
-                for fid in friend_ids:
-                    cursor.execute("SELECT id FROM users WHERE id = ?", (fid,))
-                    if cursor.fetchone():
-                        try:
-                            cursor.execute("INSERT INTO friends (user_id, friend_id) VALUES (?, ?)", (user_id, fid))
-                            cursor.execute("INSERT INTO friends (user_id, friend_id) VALUES (?, ?)", (fid, user_id))
-                        except sqlite3.IntegrityError:
-                            continue
+                placeholders = ','.join('?' * len(friend_ids))
+                cursor.execute(f"SELECT id FROM users WHERE id IN ({placeholders})", list(friend_ids))
+                valid_ids = [row['id'] for row in cursor.fetchall()]
+                cursor.executemany(
+                    "INSERT OR IGNORE INTO friends (user_id, friend_id) VALUES (?, ?)",
+                    [(user_id, fid) for fid in valid_ids] + [(fid, user_id) for fid in valid_ids]
+                )
 
             self.db.connection.commit()
             return user_id
@@ -116,67 +143,155 @@ class User:
             cursor.close()
 
     def get_user(self, user_id: int):
-        cursor = self.db.connection.cursor()
-        try:
-            cursor.execute("SELECT * FROM users WHERE id = ?", (user_id,))
-            row = cursor.fetchone()
-            return dict(row) if row else None
-        finally:
-            cursor.close()
+        row = self.db.connection.execute("SELECT * FROM users WHERE id = ?", (user_id,)).fetchone()
+        return dict(row) if row else None
 
     def get_user_by_email(self, email: str):
-        cursor = self.db.connection.cursor()
-        try:
-            cursor.execute("SELECT * FROM users WHERE email = ?", (email,))
-            row = cursor.fetchone()
-            return dict(row) if row else None
-        finally:
-            cursor.close()
+        row = self.db.connection.execute("SELECT * FROM users WHERE email = ?", (email,)).fetchone()
+        return dict(row) if row else None
 
     def get_all_users(self):
-        cursor = self.db.connection.cursor()
-        try:
-            cursor.execute("SELECT * FROM users")
-            return [dict(row) for row in cursor.fetchall()]
-        finally:
-            cursor.close()
+        return [dict(row) for row in self.db.connection.execute("SELECT * FROM users")]
 
     def get_user_interests(self, user_id: int) -> Set[str]:
-        cursor = self.db.connection.cursor()
-        try:
-            cursor.execute("SELECT interest FROM interests WHERE user_id = ?", (user_id,))
-            return {row['interest'] for row in cursor.fetchall()}
-        finally:
-            cursor.close()
+        return {row['interest'] for row in
+                self.db.connection.execute("SELECT interest FROM interests WHERE user_id = ?", (user_id,))}
 
 class RecommendationEngine:
     def __init__(self, db_manager: DatabaseManager):
         self.db = db_manager
-        self.user_manager = User(db_manager)
-        self.graph = nx.Graph()
-        self._build_graph()
+        self.tag_to_bit: Dict[str, int] = {}
+        self.bit_to_tag: List[str] = []
+        self.users_by_tag: List[Set[int]] = []
+        self.adj: Dict[int, Set[int]] = defaultdict(set)
+        self.node_ids: Set[int] = set()
+        self.users_by_id: Dict[int, Dict] = {}
+        self.interest_bits: Dict[int, int] = {}
+        self._graph_built = False
+        # Scored top-k per (user_id, limit), cleared whenever the graph changes
+        self._top_k = lru_cache(maxsize=100000)(self._score_candidates)
+
+    def _ensure_graph(self):
+        if not self._graph_built:
+            self._build_graph()
+            self._graph_built = True
 
     def _build_graph(self):
-        users = self.user_manager.get_all_users()
-        for user in users:
-            self.graph.add_node(user['id'], name=user['name'], email=user['email'])
+        self.users_by_id = self._load_users_by_id()
+        self.node_ids = set(self.users_by_id)
 
-        cursor = self.db.connection.cursor()
-        cursor.execute("SELECT user_id, friend_id FROM friends")
-        for row in cursor.fetchall():
-            self.graph.add_edge(row['user_id'], row['friend_id'])
-        cursor.close()
+        for row in self.db.connection.execute("SELECT user_id, friend_id FROM friends"):
+            self.adj[row['user_id']].add(row['friend_id'])
+            self.adj[row['friend_id']].add(row['user_id'])
+
+        self.interest_bits = self._load_interest_bits()
+        for uid in self.node_ids:
+            self._index_interests(uid, self.interest_bits.setdefault(uid, 0))
+
+    def on_user_added(self, user_id: int, name: str, email: str, interests: Set[str]):
+        # Before the first build the new row is simply picked up from the database
+        if not self._graph_built:
+            return
+        self.node_ids.add(user_id)
+        self.users_by_id[user_id] = {'id': user_id, 'name': name, 'email': email}
+        self.interest_bits[user_id] = self._interest_bits(interests)
+        self._index_interests(user_id, self.interest_bits[user_id])
+        self._top_k.cache_clear()
+        # Pick up exactly the edges create_user wrote, whatever friend_ids it was given
+        for row in self.db.connection.execute("SELECT friend_id FROM friends WHERE user_id = ?", (user_id,)):
+            self.on_friendship_added(user_id, row['friend_id'])
+
+    def on_friendship_added(self, user1_id: int, user2_id: int):
+        if not self._graph_built:
+            return
+        self.adj[user1_id].add(user2_id)
+        self.adj[user2_id].add(user1_id)
+        self._top_k.cache_clear()
+
+    @classmethod
+    def from_snapshot(cls, snapshot: Dict) -> 'RecommendationEngine':
+        engine = cls(None)
+        engine.tag_to_bit = snapshot['tag_to_bit']
+        engine.bit_to_tag = snapshot['bit_to_tag']
+        engine.users_by_tag = snapshot['users_by_tag']
+        engine.adj = defaultdict(set, snapshot['adj'])
+        engine.node_ids = snapshot['node_ids']
+        engine.users_by_id = snapshot['users_by_id']
+        engine.interest_bits = snapshot['interest_bits']
+        engine._graph_built = True
+        return engine
+
+    def snapshot(self) -> Dict:
+        self._ensure_graph()
+        return {
+            'tag_to_bit': self.tag_to_bit,
+            'bit_to_tag': self.bit_to_tag,
+            'users_by_tag': self.users_by_tag,
+            'adj': dict(self.adj),
+            'node_ids': self.node_ids,
+            'users_by_id': self.users_by_id,
+            'interest_bits': self.interest_bits
+        }
+
+    def get_all_users(self) -> List[Dict]:
+        self._ensure_graph()
+        return [dict(user) for user in self.users_by_id.values()]
+
+    def _tag_bit(self, interest: str) -> int:
+        interest = sys.intern(interest)
+        bit = self.tag_to_bit.get(interest)
+        if bit is None:
+            bit = self.tag_to_bit[interest] = len(self.bit_to_tag)
+            self.bit_to_tag.append(interest)
+            self.users_by_tag.append(set())
+        return 1 << bit
+
+    def _interest_bits(self, interests: Set[str]) -> int:
+        bits = 0
+        for interest in interests:
+            bits |= self._tag_bit(interest)
+        return bits
+
+    def _bit_indices(self, bits: int) -> List[int]:
+        indices = []
+        while bits:
+            low = bits & -bits
+            indices.append(low.bit_length() - 1)
+            bits ^= low
+        return indices
+
+    def _decode_interests(self, bits: int) -> List[str]:
+        return [self.bit_to_tag[i] for i in self._bit_indices(bits)]
+
+    def _index_interests(self, user_id: int, bits: int):
+        for i in self._bit_indices(bits):
+            self.users_by_tag[i].add(user_id)
+
+    def _load_interest_bits(self) -> Dict[int, int]:
+        interest_bits = {}
+        for row in self.db.connection.execute("SELECT user_id, interest FROM interests"):
+            uid = row['user_id']
+            interest_bits[uid] = interest_bits.get(uid, 0) | self._tag_bit(row['interest'])
+        return interest_bits
+
+    def _load_users_by_id(self) -> Dict[int, Dict]:
+        return {row['id']: dict(row) for row in self.db.connection.execute("SELECT id, name, email FROM users")}
 
     def jaccard_similarity(self, a: Set, b: Set) -> float:
-        return len(a & b) / len(a | b) if a or b else 0.0
+        if not a and not b:
+            return 0.0
+        inter = len(a & b)
+        return inter / (len(a) + len(b) - inter)
 
     def calculate_user_similarity(self, user1_id: int, user2_id: int) -> Dict:
-        interests1 = self.user_manager.get_user_interests(user1_id)
-        interests2 = self.user_manager.get_user_interests(user2_id)
-        friends1 = set(self.graph.neighbors(user1_id))
-        friends2 = set(self.graph.neighbors(user2_id))
-
-        interest_sim = self.jaccard_similarity(interests1, interests2)
+        self._ensure_graph()
+        bits1, bits2 = self.interest_bits[user1_id], self.interest_bits[user2_id]
+        friends1 = self.adj.get(user1_id, _NO_FRIENDS)
+        friends2 = self.adj.get(user2_id, _NO_FRIENDS)
+
+        common_count = _popcount(bits1 & bits2)
+        interest_total = _popcount(bits1) + _popcount(bits2) - common_count
+        interest_sim = common_count / interest_total if interest_total else 0.0
         mutual_sim = self.jaccard_similarity(friends1, friends2)
         combined = 0.6 * mutual_sim + 0.4 * interest_sim
 
@@ -184,31 +299,82 @@ class RecommendationEngine:
             'interest_similarity': interest_sim,
             'mutual_friends_similarity': mutual_sim,
             'combined_score': combined,
-            'common_interests': list(interests1 & interests2),
+            'common_interests': self._decode_interests(bits1 & bits2),
             'mutual_friends_count': len(friends1 & friends2)
         }
 
     def get_friend_recommendations(self, user_id: int, limit: int = 5) -> List[Dict]:
-        current_friends = set(self.graph.neighbors(user_id))
-        candidates = set(self.graph.nodes) - current_friends - {user_id}
+        self._ensure_graph()
         recommendations = []
-
-        for cid in candidates:
+        for score, cid in self._top_k(user_id, limit):
             sim = self.calculate_user_similarity(user_id, cid)
-            if sim['combined_score'] > 0:
-                user = self.user_manager.get_user(cid)
-                recommendations.append({
-                    'user_id': cid,
-                    'name': user['name'],
-                    'email': user['email'],
-                    'similarity_score': sim['combined_score'],
-                    'common_interests': sim['common_interests'],
-                    'mutual_friends_count': sim['mutual_friends_count'],
-                    'interest_similarity': sim['interest_similarity'],
-                    'mutual_friends_similarity': sim['mutual_friends_similarity']
-                })
-
-        return sorted(recommendations, key=lambda r: r['similarity_score'], reverse=True)[:limit]
+            user = self.users_by_id[cid]
+            recommendations.append({
+                'user_id': cid,
+                'name': user['name'],
+                'email': user['email'],
+                'similarity_score': score,
+                'common_interests': sim['common_interests'],
+                'mutual_friends_count': sim['mutual_friends_count'],
+                'interest_similarity': sim['interest_similarity'],
+                'mutual_friends_similarity': sim['mutual_friends_similarity']
+            })
+        return recommendations
+
+    def _score_candidates(self, user_id: int, limit: int) -> Tuple[Tuple[float, int], ...]:
+        adj = self.adj
+        current_friends = adj.get(user_id, _NO_FRIENDS)
+        bits1 = self.interest_bits[user_id]
+        interest_count1 = _popcount(bits1)
+        # Row user_id of A @ A: mutual friend counts for every friend-of-friend at once
+        mutual_counts = Counter()
+        for fid in current_friends:
+            mutual_counts.update(adj.get(fid, _NO_FRIENDS))
+        # Only users sharing at least one friend or one interest can score above zero
+        candidates = set(mutual_counts)
+        for i in self._bit_indices(bits1):
+            candidates |= self.users_by_tag[i]
+        candidates -= current_friends
+        candidates.discard(user_id)
+        degree1 = len(current_friends)
+        interest_bits = self.interest_bits
+        scored = []
+
+        # Score only; per-candidate dicts are built for the top `limit` alone
+        for cid in candidates:
+            bits2 = interest_bits[cid]
+            common_count = _popcount(bits1 & bits2)
+            mutual_count = mutual_counts[cid]
+            interest_total = interest_count1 + _popcount(bits2) - common_count
+            friend_total = degree1 + len(adj.get(cid, _NO_FRIENDS)) - mutual_count
+            interest_sim = common_count / interest_total if interest_total else 0.0
+            mutual_sim = mutual_count / friend_total if friend_total else 0.0
+            scored.append((0.6 * mutual_sim + 0.4 * interest_sim, cid))
+
+        return tuple(heapq.nlargest(limit, scored))
+
+    def get_batch_recommendations(self, user_ids: List[int], limit: int = 5,
+                                  max_workers: Optional[int] = None) -> Dict[int, List[Dict]]:
+        if not user_ids:
+            return {}
+        # Each worker unpickles the snapshot once in its initializer, not once per task
+        results = {}
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                                 initargs=(self.snapshot(),)) as executor:
+            futures = [executor.submit(_recommend_worker, uid, limit) for uid in user_ids]
+            for future in as_completed(futures):
+                uid, recs = future.result()
+                results[uid] = recs
+        return results
+
+_worker_engine = None
+
+def _init_worker(snapshot: Dict):
+    global _worker_engine
+    _worker_engine = RecommendationEngine.from_snapshot(snapshot)
+
+def _recommend_worker(user_id: int, limit: int):
+    return user_id, _worker_engine.get_friend_recommendations(user_id, limit)
 
 class FriendRecommendationApp:
     def __init__(self):
@@ -216,6 +382,7 @@ class FriendRecommendationApp:
         self.user_manager = None
         self.recommendation_engine = None
         self.current_user_id = None
+        self.current_profile = None
 
     def initialize(self):
         if not self.db.connect():
@@ -253,11 +420,16 @@ class FriendRecommendationApp:
                 email = input("Enter email: ")
                 interests = input("Enter interests (comma-separated): ").split(',')
                 uid = self.user_manager.create_user(name, email, interests)
+                if uid:
+                    self.recommendation_engine.on_user_added(uid, name, email,
+                                                             self.user_manager.get_user_interests(uid))
                 print(f"User created with ID: {uid}")
             elif choice == '2':
                 uid = int(input("Enter User ID: "))
-                if self.user_manager.get_user(uid):
+                user = self.user_manager.get_user(uid)
+                if user:
                     self.current_user_id = uid
+                    self.current_profile = {'user': user, 'interests': self.user_manager.get_user_interests(uid)}
                     print("Logged in.")
                 else:
                     print("User not found.")
@@ -265,8 +437,8 @@ class FriendRecommendationApp:
                 if not self.current_user_id:
                     print("Please login first.")
                     continue
-                user = self.user_manager.get_user(self.current_user_id)
-                interests = self.user_manager.get_user_interests(self.current_user_id)
+                user = self.current_profile['user']
+                interests = self.current_profile['interests']
                 print(f"\n--- Profile: {user['name']} ---")
                 print(f"User ID: {user['id']}")
                 print(f"Email: {user['email']}")
@@ -279,7 +451,7 @@ class FriendRecommendationApp:
                 for r in recs:
                     print(f"{r['name']} ({r['email']}) - Score: {r['similarity_score']:.2f}, Mutuals: {r['mutual_friends_count']}, Interests: {', '.join(r['common_interests'])}")
             elif choice == '5':
-                users = self.user_manager.get_all_users()
+                users = self.recommendation_engine.get_all_users()
                 print("\n--- All Users ---")
                 for user in users:
                     print(f"ID: {user['id']} | Name: {user['name']} | Email: {user['email']}")